@@ -1,7 +1,7 @@
 # ---------------------------------------------------------------------------
 # Template script for alliance or strata descriptions
 # Author: Timm Nawrocki, Amanda Droghini, Rhiannon Glover, Lindsey Flagstad, Alaska Center for Conservation Science
-# Last Updated: 2026-02-10
+# Last Updated: 2026-10-15
 # Usage: Must be executed in a Python 3.12+ installation.
 # Description: "Template script for alliance or strata descriptions" provides a template for writing descriptions for alliances or strata from the AKVEG Database and a data entry file.
 # ---------------------------------------------------------------------------
@@ -10,21 +10,29 @@
 unit_code = '29_ArcticBrownMossSedgePeatlandMinerotrophic'
 
 # Import libraries
+import gzip
+import hashlib
+import html
+import importlib.metadata
+import io
 import os
-from dbfread import DBF
-import markdown
+import queue
+import re
+import shutil
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import cmarkgfm
+from cmarkgfm.cmark import Options as cmarkgfm_options
 import numpy as np
 import pandas as pd
 import geopandas as gpd
+import pyogrio
 import rasterio
 import plotly.express as px
 import plotly.graph_objects as go
 import kaleido
 from akutils import connect_database_postgresql
-from akutils import query_to_dataframe
-
-# Initialize kaleido
-kaleido.get_chrome_sync()
 
 #### SET UP DIRECTORIES, FILES, AND FIELDS
 ####____________________________________________________
@@ -40,6 +48,31 @@ description_folder = os.path.join(drive, root_folder, 'Repositories/class-descri
 input_folder = os.path.join(description_folder, '00_data_entry')
 plot_folder = os.path.join(description_folder, '02_plot_html')
 output_folder = os.path.join(description_folder, '03_description_html')
+cache_folder = os.path.join(description_folder, 'query_cache')
+
+# Set query cache use (set to True to reuse query results between runs while the AKVEG Database is unchanged)
+use_query_cache = False
+
+# Set AKVEG Database version label for cached queries (change after AKVEG Database updates so that cached results are
+# not reused; cached results for each label are stored in a separate subfolder that can be deleted to clear the cache)
+database_version = '20261015'
+
+# Set workbook cache use (set to True to read the diagnostic schema from a Parquet copy until the workbook is saved)
+use_schema_cache = False
+
+# Set html cache use (set to True to reuse rendered description html while its inputs are unchanged)
+use_html_cache = False
+
+# Set html page version (increase after editing the page layout or table of contents code so that cached html is
+# re-rendered)
+page_version = 1
+
+# Set precompressed html export (set to True to write a gzip copy of the description html for static hosting)
+export_compressed = False
+
+# Set static image export (set to True to write PNG plots, which requires kaleido to start Chrome)
+export_images = False
+kaleido_ready = False
 
 # Define input data
 veg_input = os.path.join(drive, root_folder,
@@ -57,107 +90,628 @@ schema_input = os.path.join(drive, root_folder,
 text_input = os.path.join(input_folder, f'{unit_code}.md')
 
 # Define queries
-taxa_file = os.path.join(database_repository, 'queries/00_taxonomy.sql')
-project_file = os.path.join(database_repository, 'queries/01_project.sql')
-site_visit_file = os.path.join(database_repository, 'queries/03_site_visit.sql')
-vegetation_file = os.path.join(database_repository, 'queries/05_vegetation.sql')
-abiotic_file = os.path.join(database_repository, 'queries/06_abiotic_top_cover.sql')
-tussock_file = os.path.join(database_repository, 'queries/07_whole_tussock_cover.sql')
-ground_file = os.path.join(database_repository, 'queries/08_ground_cover.sql')
-structural_file = os.path.join(database_repository, 'queries/09_structural_group_cover.sql')
-shrub_file = os.path.join(database_repository, 'queries/11_shrub_structure.sql')
-environment_file = os.path.join(database_repository, 'queries/12_environment.sql')
-soilmetrics_file = os.path.join(database_repository, 'queries/13_soil_metrics.sql')
-soilhorizons_file = os.path.join(database_repository, 'queries/14_soil_horizons.sql')
+query_files = {
+    'taxa': os.path.join(database_repository, 'queries/00_taxonomy.sql'),
+    'project': os.path.join(database_repository, 'queries/01_project.sql'),
+    'site_visit': os.path.join(database_repository, 'queries/03_site_visit.sql'),
+    'vegetation': os.path.join(database_repository, 'queries/05_vegetation.sql'),
+    'abiotic': os.path.join(database_repository, 'queries/06_abiotic_top_cover.sql'),
+    'tussock': os.path.join(database_repository, 'queries/07_whole_tussock_cover.sql'),
+    'ground': os.path.join(database_repository, 'queries/08_ground_cover.sql'),
+    'structural': os.path.join(database_repository, 'queries/09_structural_group_cover.sql'),
+    'shrub': os.path.join(database_repository, 'queries/11_shrub_structure.sql'),
+    'environment': os.path.join(database_repository, 'queries/12_environment.sql'),
+    'soilmetrics': os.path.join(database_repository, 'queries/13_soil_metrics.sql'),
+    'soilhorizons': os.path.join(database_repository, 'queries/14_soil_horizons.sql')
+}
+
+# Define html page styles
+rmarkdown_style = """
+<style>
+    body {
+        font-family: "Helvetica Neue", Helvetica, Arial, sans-serif;
+        font-size: 16px;
+        line-height: 1.6;
+        color: #333;
+        background-color: #fff;
+        margin: 0;
+        padding: 0;
+    }
+
+    /* Layout Wrapper */
+    .wrapper {
+        display: flex;
+        max-width: 1200px;
+        margin: 0 auto;
+    }
+
+    /* Sidebar Navigation (TOC) */
+    #TOC {
+        width: 250px;
+        position: fixed;
+        top: 0;
+        left: 0;
+        bottom: 0;
+        overflow-y: auto;
+        padding: 40px 20px;
+        background-color: #f8f8f8;
+        border-right: 1px solid #e7e7e7;
+        font-size: 0.9em;
+    }
+    #TOC ul {
+        list-style: none;
+        padding-left: 0;
+        margin: 0;
+    }
+    #TOC ul ul {
+        padding-left: 20px; /* Indent nested levels */
+    }
+    #TOC li {
+        margin-bottom: 8px;
+    }
+    #TOC a {
+        color: #333;
+        text-decoration: none;
+        display: block;
+        padding: 6px 10px;
+        border-radius: 4px;
+        transition: background-color 0.1s;
+    }
+    #TOC a:hover {
+        color: #337ab7;
+        background-color: #eee;
+    }
+
+    /* Main Content */
+    .main-content {
+        margin-left: 270px; /* Sidebar width + gap */
+        padding: 40px 40px;
+        max-width: 850px;
+        flex: 1;
+    }
+
+    /* Typography */
+    h1, h2, h3 {
+        color: #333;
+        font-weight: 600;
+        margin-bottom: 0.5em;
+        scroll-margin-top: 20px; /* Offset for anchor links */
+    }
+    h1 { font-size: 2.2em; border-bottom: 1px solid #eee; padding-bottom: 10px; }
+    h2 { font-size: 1.6em; border-bottom: 1px solid #eee; padding-bottom: 5px; }
+    h3 { font-size: 1.3em; }
+
+    /* Tables */
+    table {
+        width: 100%;
+        margin-bottom: 20px;
+        border-collapse: collapse;
+        font-size: 0.9em;
+    }
+    th, td { padding: 8px 12px; text-align: left; border-top: 1px solid #ddd; }
+    th { font-weight: bold; border-bottom: 2px solid #ddd; }
+    tr:hover {
+        background-color: #e6f7ff;
+    }
+
+    /* Images */
+    img {
+        max-width: 100%;
+        display: block; /* Default block, inline-block handled inline */
+        margin: 20px auto;
+        box-shadow: 0 0 5px rgba(0,0,0,0.1);
+    }
+
+    /* Links */
+    .main-content a { color: #337ab7; text-decoration: none; }
+    .main-content a:hover { text-decoration: underline; }
+
+    /* Mobile Responsive */
+    @media (max-width: 768px) {
+        #TOC {
+            position: relative;
+            width: 100%;
+            height: auto;
+            border-right: none;
+            border-bottom: 1px solid #e7e7e7;
+        }
+        .main-content {
+            margin-left: 0;
+            padding: 20px;
+        }
+        .wrapper { display: block; }
+    }
+</style>
+"""
+
+# Minify page styles by removing comments and whitespace that browsers ignore
+rmarkdown_style = re.sub(r'/\*.*?\*/', '', rmarkdown_style, flags=re.DOTALL)
+rmarkdown_style = re.sub(r'\s*([{}:;,>])\s*', r'\1', re.sub(r'\s+', ' ', rmarkdown_style))
+rmarkdown_style = rmarkdown_style.replace(';}', '}').strip()
 
 #### DEFINE FUNCTIONS
 ####------------------------------
 
-# Define 10th percentile
-def percentile_10(x):
-    return x.quantile(0.10)
+# Initialize kaleido on first image export
+def ensure_kaleido():
+    global kaleido_ready
+    if not kaleido_ready:
+        kaleido.get_chrome_sync()
+        kaleido_ready = True
 
-# Define 25th percentile
-def percentile_25(x):
-    return x.quantile(0.25)
+# Define a function to summarize a numeric series with the median and percentiles from a single partial sort
+def summarize_values(values):
+    value_array = values.to_numpy(dtype=float)
 
-# Define 75th percentile
-def percentile_75(x):
-    return x.quantile(0.75)
+    # Return missing statistics for empty series
+    if value_array.size == 0:
+        return pd.Series(np.nan, name=values.name,
+                         index=['mean', 'std', 'median', 'min', 'max',
+                                'percentile_10', 'percentile_25', 'percentile_75', 'percentile_90'])
 
-# Define 90th percentile
-def percentile_90(x):
-    return x.quantile(0.90)
+    # Calculate percentiles together
+    value_percentiles = np.quantile(value_array, [0.10, 0.25, 0.50, 0.75, 0.90])
 
-# Define a function to parse text from a markdown file
-def parse_markdown(text_input, label):
-    # Import package
-    import re
+    # Return outputs
+    return pd.Series({'mean': value_array.mean(),
+                      'std': value_array.std(ddof=1) if value_array.size > 1 else np.nan,
+                      'median': value_percentiles[2],
+                      'min': value_array.min(),
+                      'max': value_array.max(),
+                      'percentile_10': value_percentiles[0],
+                      'percentile_25': value_percentiles[1],
+                      'percentile_75': value_percentiles[3],
+                      'percentile_90': value_percentiles[4]}, name=values.name)
+
+# Define a function to summarize a numeric field after removing missing values and a sentinel value
+def summarize_field(values, sentinel):
+    values = pd.to_numeric(values.dropna())
+    return summarize_values(values[values != sentinel])
+
+# Define a function to calculate mean cover by taxon habit with absent habits counted as zero cover
+def habit_mean(cover_data):
+    # Exclude records without a taxon habit
+    habit_data = cover_data.dropna(subset=['taxon_habit'])
+
+    # Divide total cover by taxon habit by the number of site visits
+    site_count = habit_data['site_visit_code'].nunique()
+    habit_cover = (habit_data.groupby('taxon_habit', observed=True)['cover_percent'].sum()
+                   / site_count)
 
-    # Define pattern
-    pattern = r'\*\*' + label + r':\*\*\s*(.*)'
+    # Return outputs
+    return habit_cover.to_frame(name='mean')
+
+# Define a function to format taxon habits and structure elements as display labels
+def format_habits(habits):
+    habit_labels = {habit: habit.title().replace('Spore-Bearing', 'Spore-bearing')
+                    for habit in habits.dropna().unique()}
+    return habits.map(habit_labels)
+
+# Define a function to calculate occurrences and constancy (%) of groups across site visits within partitions
+def calculate_constancy(cover_data, group_field, partition_field=None):
+    # Count occurrences of each observed group in order of first appearance
+    group_fields = [field for field in [partition_field, group_field] if field is not None]
+    occurrences = cover_data.groupby(group_fields, observed=True, sort=False).size()
+
+    # Count site visits in the partition of each group
+    if partition_field is None:
+        partition_codes = np.zeros(len(occurrences), dtype=int)
+        site_count = cover_data['site_visit_code'].nunique()
+    else:
+        partition_codes = pd.factorize(occurrences.index.get_level_values(partition_field))[0]
+        site_count = (cover_data.groupby(partition_field, observed=True, sort=False)['site_visit_code'].nunique()
+                      .reindex(occurrences.index.get_level_values(partition_field))
+                      .to_numpy())
+
+    # Sort occurrences in descending order within partitions with ties kept in order of first appearance
+    occurrence_order = np.lexsort((-occurrences.to_numpy(), partition_codes))
+    occurrences = occurrences.iloc[occurrence_order]
+    if partition_field is not None:
+        site_count = site_count[occurrence_order]
 
+    # Return outputs
+    return pd.DataFrame({'occurrences': occurrences,
+                         'constancy': (occurrences / site_count) * 100})
+
+# Define a function to summarize cover by group across all site visits within partitions with absent groups
+# counted as zero cover
+def summarize_cover(cover_data, group_field, partition_field=None):
+    # Sum cover per group and site visit
+    group_fields = [field for field in [partition_field, group_field] if field is not None]
+    site_cover = (cover_data
+                  .groupby(group_fields + ['site_visit_code'], observed=True, sort=False)['cover_percent']
+                  .sum())
+
+    # Count site visits in the partition of each group
+    group_codes, group_index = pd.factorize(site_cover.index.droplevel('site_visit_code'))
+    group_index = group_index.set_names(group_fields)
+    if partition_field is None:
+        site_count = np.full(len(group_index), cover_data['site_visit_code'].nunique())
+    else:
+        site_count = (cover_data.groupby(partition_field, observed=True, sort=False)['site_visit_code'].nunique()
+                      .reindex(group_index.get_level_values(partition_field))
+                      .to_numpy())
+
+    # Sort site cover within each group
+    cover_values = site_cover.to_numpy(dtype=float)
+    cover_order = np.lexsort((cover_values, group_codes))
+    cover_values = cover_values[cover_order]
+    group_codes = group_codes[cover_order]
+    group_size = np.bincount(group_codes)
+    group_start = np.cumsum(group_size) - group_size
+    zero_count = site_count - group_size
+
+    # Calculate mean and sample standard deviation including zero cover sites
+    cover_mean = np.bincount(group_codes, weights=cover_values) / site_count
+    squared_deviation = (np.bincount(group_codes, weights=(cover_values - cover_mean[group_codes]) ** 2)
+                         + zero_count * cover_mean ** 2)
+    cover_std = np.sqrt(np.divide(squared_deviation, site_count - 1,
+                                  out=np.full(len(group_index), np.nan), where=site_count > 1))
+
+    # Define a function to select the cover value at a rank, where zero cover sites sort first
+    def ranked_cover(rank):
+        value_position = group_start + np.clip(rank - zero_count, 0, group_size - 1)
+        return np.where(rank < zero_count, 0, cover_values[value_position])
+
+    # Define a function to calculate a percentile with linear interpolation
+    def cover_percentile(q):
+        position = (site_count - 1) * q
+        lower = np.floor(position).astype(int)
+        lower_value = ranked_cover(lower)
+        return lower_value + (position - lower) * (ranked_cover(np.minimum(lower + 1, site_count - 1))
+                                                   - lower_value)
+
+    # Return outputs
+    return pd.DataFrame({'mean': cover_mean,
+                         'std': cover_std,
+                         'median': cover_percentile(0.50),
+                         'min': ranked_cover(0),
+                         'max': ranked_cover(site_count - 1),
+                         'percentile_10': cover_percentile(0.10),
+                         'percentile_25': cover_percentile(0.25),
+                         'percentile_75': cover_percentile(0.75),
+                         'percentile_90': cover_percentile(0.90)},
+                        index=group_index)
+
+# Define a function to parse text for labels from markdown content
+def parse_markdown(md_content, labels):
     # Set empty outputs
-    text_output = None
+    text_output = {}
 
-    # Parse markdown by label
+    # Parse markdown by label, keeping the first occurrence of each label
+    for label in labels:
+        match = re.search(r'\*\*' + re.escape(label) + r':\*\*\s*(.*)', md_content)
+        text_output[label] = match.group(1).strip() if match else None
+
+    # Return outputs
+    return text_output
+
+# Define a function to read a query to a data frame in chunks from a server-side cursor
+def query_to_dataframe(database_connection, query, chunk_size=50000):
+    # Stream rows from a named cursor so that the server holds the result set
+    query_chunks = []
+    with database_connection.cursor(name='stream_cursor') as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(query)
+        query_rows = cursor.fetchmany(chunk_size)
+        query_columns = [column[0] for column in cursor.description]
+        while query_rows:
+            query_chunks.append(pd.DataFrame(query_rows, columns=query_columns))
+            query_rows = cursor.fetchmany(chunk_size)
+    database_connection.commit()
+
+    # Concatenate chunks
+    if len(query_chunks) == 0:
+        return pd.DataFrame(columns=query_columns)
+    return pd.concat(query_chunks, ignore_index=True)
+
+# Define a function to create a pool of connections to the AKVEG PostgreSQL database
+def connect_database_pool(authentication_file, pool_size):
+    # Open one connection per pool slot
+    database_connections = [connect_database_postgresql(authentication_file) for i in range(pool_size)]
+
+    # Place connections in a thread-safe queue
+    connection_pool = queue.Queue()
+    for database_connection in database_connections:
+        connection_pool.put(database_connection)
+
+    # Return outputs
+    return connection_pool
+
+# Define a function to read a query using a connection borrowed from a connection pool
+def query_from_pool(connection_pool, query):
+    # Borrow a connection and return it to the pool when the query completes
+    database_connection = connection_pool.get()
     try:
-        with open(text_input, 'r', encoding='utf-8') as input_file:
-            content = input_file.read()
-        match = re.search(pattern, content)
-        if match:
-            text_output = match.group(1).strip()
+        query_data = query_to_dataframe(database_connection, query)
+    finally:
+        connection_pool.put(database_connection)
 
-    # Provide error warning
-    except FileNotFoundError:
-        print(f"Error: The file {text_input} was not found.")
+    # Return outputs
+    return query_data
+
+# Define a function to define a parquet cache file from a hash of the query text and the filter values
+def query_cache_file(query, cache_folder, cache_suffix=''):
+    query_hash = hashlib.sha1((query + cache_suffix).encode('utf-8')).hexdigest()
+    return os.path.join(cache_folder, f'{query_hash}.parquet')
+
+# Define a function to check whether all queries can be read from a parquet cache
+def queries_cached(queries, cache_folder=None, cache_suffix=''):
+    if cache_folder is None:
+        return False
+    return all(os.path.exists(query_cache_file(query, cache_folder, cache_suffix)) for query in queries)
+
+# Define a function to read a query from a parquet cache or from a connection pool
+def query_with_cache(connection_pool, query, cache_folder=None, cache_suffix=''):
+    # Read directly from the database when no cache folder is provided
+    if cache_folder is None:
+        return query_from_pool(connection_pool, query)
+
+    # Define cache file
+    cache_file = query_cache_file(query, cache_folder, cache_suffix)
+
+    # Read cached data if available
+    if os.path.exists(cache_file):
+        return pd.read_parquet(cache_file)
+
+    # Read data from the database and write to the cache
+    query_data = query_from_pool(connection_pool, query)
+    os.makedirs(cache_folder, exist_ok=True)
+    query_data.to_parquet(cache_file + '.tmp', compression='zstd')
+    os.replace(cache_file + '.tmp', cache_file)
 
     # Return outputs
-    return text_output
+    return query_data
+
+# Define a function to read workbook columns through a Parquet copy keyed by the workbook modification time
+def read_excel_with_cache(excel_input, sheet_name, columns, cache_folder=None):
+    # Read directly from the workbook when no cache folder is provided
+    if cache_folder is None:
+        return pd.read_excel(excel_input, sheet_name=sheet_name, usecols=columns)
+
+    # Define cache file from the workbook name, sheet, and modification time
+    excel_modified = os.stat(excel_input).st_mtime_ns
+    cache_prefix = f'{Path(excel_input).stem}_{sheet_name}_'
+    cache_file = os.path.join(cache_folder, f'{cache_prefix}{excel_modified}.parquet')
+
+    # Read cached data if available
+    if os.path.exists(cache_file):
+        return pd.read_parquet(cache_file)
+
+    # Read data from the workbook and write to the cache
+    sheet_data = pd.read_excel(excel_input, sheet_name=sheet_name, usecols=columns)
+    os.makedirs(cache_folder, exist_ok=True)
+    sheet_data.to_parquet(cache_file + '.tmp', compression='zstd')
+    os.replace(cache_file + '.tmp', cache_file)
+
+    # Remove cached copies of earlier versions of the workbook sheet
+    for previous_file in Path(cache_folder).iterdir():
+        previous_modified = previous_file.name.removeprefix(cache_prefix).removesuffix('.parquet')
+        if (previous_file.name.startswith(cache_prefix) and previous_file.suffix == '.parquet'
+                and previous_modified.isdigit() and previous_modified != str(excel_modified)):
+            previous_file.unlink()
+
+    # Return outputs
+    return sheet_data
+
+# Define a function to replace the terminating semicolon of a query with a join statement
+def join_query(query, join_statement):
+    # Replace the terminating semicolon
+    joined_query, replace_count = re.subn(r';\s*$', join_statement, query)
+
+    # Raise an error if the query does not end with a semicolon so that it cannot run without the join
+    if replace_count != 1:
+        raise ValueError('Query must end with a terminating semicolon to add the join statement:\n' + query)
+
+    # Return outputs
+    return joined_query
+
+# Define a function to load selected site visit codes into a temporary table
+def load_selected_visits(database_connection, site_visit_codes):
+    # Create temporary table and bulk load site visit codes
+    with database_connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS selected_visits;')
+        cursor.execute('CREATE TEMP TABLE selected_visits (site_visit_code text PRIMARY KEY);')
+        cursor.copy_expert('COPY selected_visits FROM STDIN',
+                           io.StringIO('\n'.join(site_visit_codes)))
+        cursor.execute('ANALYZE selected_visits;')
+    database_connection.commit()
+
+# Define a function to extract raster values to points with a single windowed read when the points are dense
+def extract_raster_values(raster_input, coordinates, max_window_cells=4000000, max_cells_per_point=65536):
+    # Import packages
+    from rasterio.transform import rowcol
+    from rasterio.windows import Window
+
+    # Split coordinate array into x and y arrays
+    x_values = coordinates[:, 0]
+    y_values = coordinates[:, 1]
+
+    with rasterio.open(raster_input) as src:
+        # Convert coordinates to raster rows and columns
+        rows, cols = rowcol(src.transform, x_values, y_values)
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+
+        # Assign no data to points outside the raster extent
+        inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+        nodata = src.nodata if src.nodata is not None else 0
+        raster_values = np.full(len(rows), nodata, dtype=src.dtypes[0])
+
+        # Read the window covering all points or sample points individually if the window is large or sparse
+        if inside.any():
+            row_off = rows[inside].min()
+            col_off = cols[inside].min()
+            window = Window(col_off, row_off,
+                            cols[inside].max() - col_off + 1,
+                            rows[inside].max() - row_off + 1)
+            window_cells = window.width * window.height
+            if window_cells <= min(max_window_cells, inside.sum() * max_cells_per_point):
+                window_data = src.read(1, window=window)
+                raster_values[inside] = window_data[rows[inside] - row_off, cols[inside] - col_off]
+            else:
+                extracted_values = src.sample(np.column_stack([x_values[inside], y_values[inside]]), indexes=1)
+                raster_values[inside] = np.fromiter((x[0] for x in extracted_values),
+                                                    dtype=raster_values.dtype, count=inside.sum())
+
+    # Return outputs
+    return raster_values
+
+# Define a function to compile a placeholder pattern once per set of placeholder keys
+@lru_cache(maxsize=8)
+def compile_placeholders(placeholder_keys):
+    # Match longer placeholders first so that no placeholder is shadowed by a shorter placeholder it begins with
+    return re.compile('|'.join(re.escape(key) for key in sorted(placeholder_keys, key=len, reverse=True)))
+
+# Define a function to number h2 and h3 headings and build a nested table of contents in a single pass
+def build_toc(html_content):
+    # Assign sequential ids to headings and record their levels and text
+    headings = []
+    def number_heading(match):
+        heading_id = f'header-{len(headings)}'
+        headings.append((int(match.group(1)[1]) - 1, heading_id, re.sub(r'<[^>]+>', '', match.group(2))))
+        return f'<{match.group(1)} id="{heading_id}">{match.group(2)}</{match.group(1)}>'
+    html_content = re.sub(r'<(h[23])>(.*?)</\1>', number_heading, html_content)
+
+    # Return empty table of contents if no headings are present
+    if not headings:
+        return html_content, ''
+
+    # Nest h3 entries under the preceding h2 entry
+    toc_html = io.StringIO()
+    toc_html.write('<ul>')
+    current_level = 1
+    item_open = False
+    for level, heading_id, heading_text in headings:
+        if level > current_level:
+            toc_html.write('<ul>' if item_open else '<li><ul>')
+        elif level < current_level:
+            toc_html.write('</li></ul></li>' if item_open else '</ul></li>')
+        elif item_open:
+            toc_html.write('</li>')
+        toc_html.write(f'<li><a href="#{heading_id}">{heading_text}</a>')
+        current_level = level
+        item_open = True
+    toc_html.write('</li></ul></li></ul>' if current_level > 1 else '</li></ul>')
+
+    # Return outputs
+    return html_content, toc_html.getvalue()
+
+# Define a function to render a markdown description with placeholder replacements to an html file
+def render_description(md_content, replacements, unit_name, html_output, cache_folder=None):
+    # Convert replacement values to text
+    replacements = {key: str(value) for key, value in replacements.items()}
+
+    # Copy cached html if the markdown, replacements, unit name, page style, page version, and renderer are unchanged
+    if cache_folder is not None:
+        page_hash = hashlib.sha1('\0'.join([md_content, unit_name, rmarkdown_style, str(page_version),
+                                            importlib.metadata.version('cmarkgfm'),
+                                            *[key + '\0' + value for key, value in replacements.items()]])
+                                 .encode('utf-8')).hexdigest()
+        cache_file = os.path.join(cache_folder, f'{page_hash}.html')
+        if os.path.exists(cache_file):
+            shutil.copyfile(cache_file, html_output)
+            return
+
+    # Replace text placeholders with html in a single pass over the markdown
+    placeholder_pattern = compile_placeholders(frozenset(replacements))
+    md_content = placeholder_pattern.sub(lambda match: replacements[match.group(0)], md_content)
+
+    # Render markdown with tables and raw html (plots and tables) passed through
+    html_content = cmarkgfm.markdown_to_html_with_extensions(md_content,
+                                                             options=cmarkgfm_options.CMARK_OPT_UNSAFE,
+                                                             extensions=['table'])
+
+    # Number headings and build the table of contents
+    html_content, toc_html = build_toc(html_content)
+
+    # Export html file by writing the encoded page fragments around the rendered content through a large buffer
+    with open(html_output, 'wb', buffering=1 << 20) as output_file:
+        output_file.writelines(fragment.encode('utf-8') for fragment in [
+            '\n<!DOCTYPE html>\n<html>\n<head>\n'
+            '    <meta charset="utf-8">\n'
+            '    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+            '    <title>', html.escape(unit_name), '</title>\n    ',
+            rmarkdown_style,
+            '\n</head>\n<body>\n'
+            '    <div class="wrapper">\n'
+            '        <div id="TOC">\n            ',
+            toc_html,
+            '</div>\n'
+            '        <div class="main-content">\n            ',
+            html_content,
+            '\n        </div>\n    </div>\n'
+            '</body>\n</html>\n'
+        ])
+
+    # Write rendered html to the cache
+    if cache_folder is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        shutil.copyfile(html_output, cache_file + '.tmp')
+        os.replace(cache_file + '.tmp', cache_file)
+
+# Define a function to write a gzip-compressed copy of a file alongside the file for static hosting
+def write_gzip_copy(file_input):
+    with open(file_input, 'rb') as input_file, \
+            gzip.GzipFile(file_input + '.gz', 'wb', compresslevel=9, mtime=0) as output_file:
+        shutil.copyfileobj(input_file, output_file)
 
 #### PARSE TEXT DESCRIPTIONS
 ####____________________________________________________
 
-# Parse unit name
-unit_name = parse_markdown(text_input, 'Unit Name')
-level_text = parse_markdown(text_input, 'Level')
-photo_text = parse_markdown(text_input, 'Photos')
+# Read markdown description once for parsing and rendering
+md_content = Path(text_input).read_text(encoding='utf-8')
+
+# Parse unit name, level, and photos
+markdown_fields = parse_markdown(md_content, ['Unit Name', 'Level', 'Photos'])
+unit_name = markdown_fields.get('Unit Name')
+level_text = markdown_fields.get('Level')
+photo_text = markdown_fields.get('Photos')
 photo_list = photo_text.split(', ')
 
 #### QUERY AND FILTER AKVEG SITE VISITS
 ####------------------------------
 
-# Create a connection to the AKVEG PostgreSQL database
+# Define query cache for the AKVEG Database version
+query_cache = os.path.join(cache_folder, database_version) if use_query_cache else None
+
+# Read all query files
+queries = {query_name: Path(query_file).read_text() for query_name, query_file in query_files.items()}
+
+# Create a pool of connections to the AKVEG PostgreSQL database unless all initial queries are cached
 authentication_file = os.path.join(credentials_folder, 'authentication_akveg_private.csv')
-database_connection = connect_database_postgresql(authentication_file)
-
-# Read taxonomy standard from AKVEG Database
-taxa_read = open(taxa_file, 'r')
-taxa_query = taxa_read.read()
-taxa_read.close()
-taxa_data = query_to_dataframe(database_connection, taxa_query)
-
-# Read site visit data from AKVEG Database
-site_visit_read = open(site_visit_file, 'r')
-site_visit_query = site_visit_read.read()
-site_visit_read.close()
-site_visit_data = query_to_dataframe(database_connection, site_visit_query)
-site_visit_data['obs_datetime'] = pd.to_datetime(site_visit_data['observe_date'])
-site_visit_data['obs_year'] = site_visit_data['obs_datetime'].dt.year
+pool_size = 8
+connection_pool = None
+if not queries_cached([queries['taxa'], queries['site_visit']], query_cache):
+    connection_pool = connect_database_pool(authentication_file, pool_size)
+
+# Read taxonomy standard and site visit data from AKVEG Database with concurrent queries
+with ThreadPoolExecutor(max_workers=2) as executor:
+    taxa_data, site_visit_data = executor.map(
+        lambda query: query_with_cache(connection_pool, query, query_cache),
+        [queries['taxa'], queries['site_visit']])
+
+# Convert repeatedly filtered taxonomy fields to categorical
+for field in ['taxon_category', 'taxon_genus']:
+    taxa_data[field] = taxa_data[field].astype('category')
+
+# Index taxonomy attributes by taxon name for joins
+taxa_indexed = taxa_data.set_index('taxon_name')[[
+    'taxon_genus', 'taxon_level', 'taxon_category', 'taxon_habit'
+]].copy()
 
-# Create geodataframe
-site_visit_data = gpd.GeoDataFrame(
-    site_visit_data,
-    geometry=gpd.points_from_xy(site_visit_data.longitude_dd,
-                                site_visit_data.latitude_dd),
-    crs='EPSG:4269')
+# Correct ambiguous taxon habits
+taxa_indexed['taxon_habit'] = taxa_indexed['taxon_habit'].replace({'dwarf shrub, shrub': 'shrub',
+                                                                   'dwarf shrub, shrub, tree': 'shrub'})
+taxa_indexed = taxa_indexed.astype({'taxon_level': 'category', 'taxon_habit': 'category'})
 
-# Convert geodataframe to EPSG:3338
-site_visit_data = site_visit_data.to_crs(crs='EPSG:3338')
+# Parse site visit observation dates
+site_visit_data['obs_datetime'] = pd.to_datetime(site_visit_data['observe_date'])
+site_visit_data['obs_year'] = site_visit_data['obs_datetime'].dt.year
 
-# Extract coordinates in EPSG:3338
-site_visit_data['cent_x'] = site_visit_data.geometry.x
-site_visit_data['cent_y'] = site_visit_data.geometry.y
+# Convert repeatedly filtered site visit fields to categorical
+for field in ['perspective', 'scope_vascular', 'scope_bryophyte', 'scope_lichen']:
+    site_visit_data[field] = site_visit_data[field].astype('category')
 
 # Filter by observation year
 site_visit_data = site_visit_data[site_visit_data['obs_year'] >= 2000]
@@ -180,44 +734,47 @@ lichen_sites = site_visit_data[
     site_visit_data['scope_lichen'].isin(['exhaustive', 'non-trace species', 'common species'])
 ]
 
+# Create geodataframe for filtered site visits
+site_visit_data = gpd.GeoDataFrame(
+    site_visit_data,
+    geometry=gpd.points_from_xy(site_visit_data.longitude_dd,
+                                site_visit_data.latitude_dd),
+    crs='EPSG:4269')
+
+# Convert geodataframe to EPSG:3338
+site_visit_data = site_visit_data.to_crs(crs='EPSG:3338')
+
+# Extract coordinates in EPSG:3338
+site_visit_data['cent_x'] = site_visit_data.geometry.x
+site_visit_data['cent_y'] = site_visit_data.geometry.y
+
 # Identify coordinates from site visit data
-coordinates = [(x, y) for x, y in zip(site_visit_data.geometry.x, site_visit_data.geometry.y)]
+coordinates = site_visit_data[['cent_x', 'cent_y']].to_numpy()
 
 # Extract raster EVT to sites
-with rasterio.open(veg_input) as src:
-    # Extract raster values
-    extracted_values = src.sample(coordinates)
-    # Append values to data frame
-    site_visit_data['raster_value'] = [x[0] for x in extracted_values]
-
-# Extract elevation raster to sites
-with rasterio.open(elevation_input) as src:
-    # Extract raster values
-    extracted_values = src.sample(coordinates)
-    # Append values to data frame
-    site_visit_data['elevation_m'] = [x[0] for x in extracted_values]
-
-# Extract slope raster to sites
-with rasterio.open(slope_input) as src:
-    # Extract raster values
-    extracted_values = src.sample(coordinates)
-    # Append values to data frame
-    site_visit_data['slope_deg'] = [x[0] for x in extracted_values]
+site_visit_data['raster_value'] = extract_raster_values(veg_input, coordinates)
 
 # Replace value with label
-raster_attributes = DBF(veg_input + '.vat.dbf', load=True)
-attribute_data = pd.DataFrame(iter(raster_attributes))
-site_visit_data = pd.merge(left=site_visit_data,
-                           right=attribute_data,
-                           left_on='raster_value',
-                           right_on='VALUE',
-                           how='left')
-site_visit_data = site_visit_data.drop(labels=['raster_value', 'VALUE', 'COUNT'], axis=1)
-site_visit_data = site_visit_data.rename(columns={'LABEL': 'veg_type'})
+attribute_data = pyogrio.read_dataframe(veg_input + '.vat.dbf',
+                                        columns=['VALUE', 'LABEL'],
+                                        read_geometry=False)
+raster_labels = attribute_data.set_index('VALUE')['LABEL']
+site_visit_data['veg_type'] = site_visit_data.pop('raster_value').map(raster_labels)
 
 # Filter to unit name
 site_visit_data = site_visit_data[site_visit_data['veg_type'] == unit_name]
 
+# Identify coordinates for site visits within the unit
+coordinates = site_visit_data[['cent_x', 'cent_y']].to_numpy()
+
+# Extract elevation and slope rasters to sites with concurrent reads
+with ThreadPoolExecutor(max_workers=2) as executor:
+    elevation_values, slope_values = executor.map(
+        lambda raster_input: extract_raster_values(raster_input, coordinates),
+        [elevation_input, slope_input])
+site_visit_data['elevation_m'] = elevation_values
+site_visit_data['slope_deg'] = slope_values
+
 # Select columns
 site_visit_data = site_visit_data[['site_visit_code', 'project_code', 'site_code', 'data_tier',
                                    'observe_date', 'scope_vascular', 'scope_bryophyte', 'scope_lichen',
@@ -252,59 +809,55 @@ export_point_data = site_visit_data.rename(columns={'site_visit_code': 'st_vst',
 #    crs='EPSG:3338')
 #site_point_data.to_file(site_point_output)
 
-# Write where statement for site visits
-input_sql = '\r\nWHERE site_visit.site_visit_code IN ('
-for site_visit in site_visit_data['site_visit_code']:
-    input_sql = input_sql + r"'" + site_visit + r"', "
-input_sql = input_sql[:-2] + r');'
-
-# Read project data from AKVEG Database for selected site visits
-project_read = open(project_file, 'r')
-project_query = project_read.read()
-project_read.close()
-project_query = project_query.replace(';', input_sql)
-project_data = query_to_dataframe(database_connection, project_query).sort_values('project_code')
-
-#### QUERY AND PROCESS AKVEG VEGETATION COVER DATA
+# Write join statement for selected site visits
+visit_join = '\r\nJOIN selected_visits ON selected_visits.site_visit_code = site_visit.site_visit_code;'
+
+# Replace terminating semicolon with join statement for queries of selected site visits
+visit_query_names = ['project', 'vegetation', 'abiotic', 'tussock', 'ground', 'structural',
+                     'shrub', 'environment', 'soilmetrics', 'soilhorizons']
+visit_queries = {query_name: join_query(queries[query_name], visit_join)
+                 for query_name in visit_query_names}
+
+# Load selected site visits into a temporary table on each pooled connection unless all site visit queries are cached
+visit_cache_suffix = '\n'.join(sorted(site_visit_data['site_visit_code']))
+if not queries_cached(visit_queries.values(), query_cache, visit_cache_suffix):
+    if connection_pool is None:
+        connection_pool = connect_database_pool(authentication_file, pool_size)
+    pooled_connections = [connection_pool.get() for i in range(pool_size)]
+    for database_connection in pooled_connections:
+        load_selected_visits(database_connection, site_visit_data['site_visit_code'])
+        connection_pool.put(database_connection)
+
+# Read data from AKVEG Database for selected site visits with concurrent queries
+with ThreadPoolExecutor(max_workers=pool_size) as executor:
+    visit_results = dict(zip(visit_queries.keys(),
+                             executor.map(lambda query: query_with_cache(connection_pool, query,
+                                                                         query_cache, visit_cache_suffix),
+                                          visit_queries.values())))
+
+# Extract project data
+project_data = visit_results['project'].sort_values('project_code')
+
+#### PROCESS AKVEG VEGETATION COVER DATA
 ####------------------------------
 
-# Read vegetation cover data from AKVEG Database for selected site visits
-vegetation_read = open(vegetation_file, 'r')
-vegetation_query = vegetation_read.read()
-vegetation_read.close()
-vegetation_query = vegetation_query.replace(';', input_sql)
-vegetation_data = query_to_dataframe(database_connection, vegetation_query)
+# Extract vegetation cover data for selected site visits
+vegetation_data = visit_results['vegetation']
+
+# Enforce absolute cover of live vegetation
+vegetation_data = vegetation_data.loc[
+    vegetation_data['cover_type'].isin(['absolute foliar cover', 'absolute canopy cover'])
+    & (vegetation_data['dead_status'] == False),
+    ['site_visit_code', 'name_accepted', 'cover_percent']
+]
 
 # Enforce numeric data type
 vegetation_data['cover_percent'] = (pd.to_numeric(vegetation_data['cover_percent'])
                                     # Replace -999 explicit absence values with 0
                                     .replace(-999, 0))
 
-# Enforce absolute cover
-vegetation_data = vegetation_data[
-    vegetation_data['cover_type'].isin(['absolute foliar cover', 'absolute canopy cover'])
-]
-
-# Enforce live vegetation
-vegetation_data = vegetation_data[vegetation_data['dead_status'] == False]
-
 # Join vegetation and taxa data
-vegetation_data = pd.merge(left=vegetation_data,
-                           right=taxa_data,
-                           left_on='name_accepted',
-                           right_on='taxon_name',
-                           how='left')
-
-# Select vegetation data fields
-vegetation_data = vegetation_data[[
-    'site_visit_code', 'name_accepted', 'cover_percent',
-    'taxon_genus', 'taxon_level', 'taxon_category', 'taxon_habit'
-]]
-
-# Correct ambiguous taxon habits
-vegetation_data = (vegetation_data
-                   .replace('dwarf shrub, shrub', 'shrub')
-                   .replace('dwarf shrub, shrub, tree', 'shrub'))
+vegetation_data = vegetation_data.join(taxa_indexed, on='name_accepted')
 
 # Filter data appropriate for vascular plant analyses
 vascular_data = vegetation_data[vegetation_data['taxon_category'].isin([
@@ -315,227 +868,97 @@ vascular_data = vegetation_data[vegetation_data['taxon_category'].isin([
 bryophyte_data = vegetation_data[vegetation_data['site_visit_code'].isin(
     bryophyte_sites['site_visit_code'].tolist()
 )]
-bryophyte_data = bryophyte_data[bryophyte_data['taxon_category'].isin([
-    'liverwort', 'moss', 'hornwort', 'functional group', 'unknown'
-])]
-bryophyte_data = bryophyte_data[(bryophyte_data['taxon_category'] != 'functional group')
-                                | ((bryophyte_data['taxon_category'] != 'functional group')
-                                   & (bryophyte_data['name_accepted'].isin([
-            'non-thalloid liverwort', 'thalloid liverwort', 'feathermoss (other)',
-            'feathermoss (N-fixing)', 'Sphagnum moss', 'turf moss'
-        ])))
-                                | ((bryophyte_data['taxon_category'] != 'unknown')
-                                   & (bryophyte_data['name_accepted'].isin([
-            'liverwort', 'moss'
-        ])))]
+bryophyte_data = bryophyte_data[
+    bryophyte_data['taxon_category'].isin(['liverwort', 'moss', 'hornwort', 'unknown'])
+    | ((bryophyte_data['taxon_category'] == 'functional group')
+       & bryophyte_data['name_accepted'].isin(['liverwort', 'moss']))
+]
 
 # Perform bryophyte aggregation
-bryophyte_unique = bryophyte_data['name_accepted'].unique()
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Brachythecium',
-                                           'Brachythecium', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Calliergon',
-                                           'Calliergon', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Cinclidium',
-                                           'Cinclidium', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Dicranum',
-                                           'Dicranum', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Drepanocladus',
-                                           'Drepanocladus', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Hamatocaulis',
-                                           'Hamatocaulis', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Loeskypnum',
-                                           'Loeskypnum', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Meesia',
-                                           'Meesia', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Polytrichum',
-                                           'Polytrichum', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Pseudocalliergon',
-                                           'Pseudocalliergon', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Racomitrium',
-                                           'Racomitrium', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Rhizomnium',
-                                           'Rhizomnium', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Sarmentypnum',
-                                           'Sarmentypnum', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Scorpidium',
-                                           'Scorpidium', bryophyte_data['name_accepted'])
-bryophyte_data['name_accepted'] = np.where(bryophyte_data['taxon_genus'] == 'Sphagnum',
-                                           'Sphagnum', bryophyte_data['name_accepted'])
+bryophyte_genera = ['Brachythecium', 'Calliergon', 'Cinclidium', 'Dicranum', 'Drepanocladus',
+                    'Hamatocaulis', 'Loeskypnum', 'Meesia', 'Polytrichum', 'Pseudocalliergon',
+                    'Racomitrium', 'Rhizomnium', 'Sarmentypnum', 'Scorpidium', 'Sphagnum']
+bryophyte_genus_mask = bryophyte_data['taxon_genus'].isin(bryophyte_genera)
+bryophyte_data.loc[bryophyte_genus_mask, 'name_accepted'] = (bryophyte_data
+                                                              .loc[bryophyte_genus_mask, 'taxon_genus'])
 
 # Calculate bryophyte sums
 bryophyte_data = (bryophyte_data.groupby(['site_visit_code', 'name_accepted'])['cover_percent']
                   .sum()
-                  .to_frame()
                   .reset_index())
-bryophyte_data = pd.merge(left=bryophyte_data,
-                          right=taxa_data,
-                          left_on='name_accepted',
-                          right_on='taxon_name',
-                          how='left')
-bryophyte_data = bryophyte_data[[
-    'site_visit_code', 'name_accepted', 'cover_percent',
-    'taxon_genus', 'taxon_level', 'taxon_category', 'taxon_habit'
-]]
+bryophyte_data = bryophyte_data.join(taxa_indexed, on='name_accepted')
 
 # Filter data appropriate for lichen analyses
 lichen_data = vegetation_data[vegetation_data['site_visit_code'].isin(
     lichen_sites['site_visit_code'].tolist()
 )]
 lichen_data = lichen_data[lichen_data['taxon_category'] == 'lichen']
-lichen_data = lichen_data[(lichen_data['taxon_category'] != 'functional group')
-                          | ((lichen_data['taxon_category'] != 'functional group')
-                             & (lichen_data['name_accepted'].isin([
-            'arboreal lichen', 'crustose lichen (orange)', 'crustose lichen (non-orange)',
-            'foliose lichen (other)', 'foliose lichen (N-fixing)', 'forage lichen',
-            'fruticose lichen (N-fixing)', 'fruticose lichen (other)'
-        ])))
-                          | ((lichen_data['taxon_category'] != 'unknown')
-                             & (lichen_data['name_accepted'].isin([
-            'lichen', 'crustose lichen', 'fruticose lichen', 'foliose lichen'
-        ])))]
 
 # Perform bryophyte aggregation
-lichen_unique = lichen_data['name_accepted'].unique()
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Bryoria',
-                                        'Bryoria', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Dactylina',
-                                        'Dactylina', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Lobaria',
-                                        'Lobaria', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Masonhalea',
-                                        'Masonhalea richardsonii', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Nephroma',
-                                        'Nephroma', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Peltigera',
-                                        'Peltigera', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Sphaerophorus',
-                                        'Sphaerophorus', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Stereocaulon',
-                                        'Stereocaulon', lichen_data['name_accepted'])
-lichen_data['name_accepted'] = np.where(lichen_data['taxon_genus'] == 'Thamnolia',
-                                        'Thamnolia', lichen_data['name_accepted'])
+lichen_genera = {'Bryoria': 'Bryoria',
+                 'Dactylina': 'Dactylina',
+                 'Lobaria': 'Lobaria',
+                 'Masonhalea': 'Masonhalea richardsonii',
+                 'Nephroma': 'Nephroma',
+                 'Peltigera': 'Peltigera',
+                 'Sphaerophorus': 'Sphaerophorus',
+                 'Stereocaulon': 'Stereocaulon',
+                 'Thamnolia': 'Thamnolia'}
+lichen_genus_mask = lichen_data['taxon_genus'].isin(list(lichen_genera))
+lichen_data.loc[lichen_genus_mask, 'name_accepted'] = (lichen_data
+                                                        .loc[lichen_genus_mask, 'taxon_genus']
+                                                        .map(lichen_genera))
 
 # Calculate lichen sums
 lichen_data = (lichen_data.groupby(['site_visit_code', 'name_accepted'])['cover_percent']
                .sum()
-               .to_frame()
                .reset_index())
-lichen_data = pd.merge(left=lichen_data,
-                       right=taxa_data,
-                       left_on='name_accepted',
-                       right_on='taxon_name',
-                       how='left')
-lichen_data = lichen_data[[
-    'site_visit_code', 'name_accepted', 'cover_percent',
-    'taxon_genus', 'taxon_level', 'taxon_category', 'taxon_habit'
-]]
+lichen_data = lichen_data.join(taxa_indexed, on='name_accepted')
 
-#### QUERY OTHER AKVEG DATA
+# Convert site visit and taxon grouping keys to categorical
+vascular_data, bryophyte_data, lichen_data = [
+    cover_data.astype({'site_visit_code': 'category', 'name_accepted': 'category'})
+    for cover_data in [vascular_data, bryophyte_data, lichen_data]
+]
+
+#### EXTRACT OTHER AKVEG DATA
 ####------------------------------
 
-# Read abiotic top cover data from AKVEG Database for selected site visits
-abiotic_read = open(abiotic_file, 'r')
-abiotic_query = abiotic_read.read()
-abiotic_read.close()
-abiotic_query = abiotic_query.replace(';', input_sql)
-abiotic_data = query_to_dataframe(database_connection, abiotic_query)
+# Extract abiotic top cover data for selected site visits
+abiotic_data = visit_results['abiotic']
 abiotic_data['cover_percent'] = pd.to_numeric(abiotic_data['cover_percent'])
 
-# Read whole tussock cover data from AKVEG Database for selected site visits
-tussock_read = open(tussock_file, 'r')
-tussock_query = tussock_read.read()
-tussock_read.close()
-tussock_query = tussock_query.replace(';', input_sql)
-tussock_data = query_to_dataframe(database_connection, tussock_query)
-
-# Read ground cover data from AKVEG Database for selected site visits
-ground_read = open(ground_file, 'r')
-ground_query = ground_read.read()
-ground_read.close()
-ground_query = ground_query.replace(';', input_sql)
-ground_data = query_to_dataframe(database_connection, ground_query)
-
-# Read structural group cover data from AKVEG Database for selected site visits
-structural_read = open(structural_file, 'r')
-structural_query = structural_read.read()
-structural_read.close()
-structural_query = structural_query.replace(';', input_sql)
-structural_data = query_to_dataframe(database_connection, structural_query)
-
-# Read shrub structure data from AKVEG Database for selected site visits
-shrub_read = open(shrub_file, 'r')
-shrub_query = shrub_read.read()
-shrub_read.close()
-shrub_query = shrub_query.replace(';', input_sql)
-shrub_data = query_to_dataframe(database_connection, shrub_query)
-
-# Read environment data from AKVEG Database for selected site visits
-environment_read = open(environment_file, 'r')
-environment_query = environment_read.read()
-environment_read.close()
-environment_query = environment_query.replace(';', input_sql)
-environment_data = query_to_dataframe(database_connection, environment_query)
-
-# Read soil metrics data from AKVEG Database for selected site visits
-soilmetrics_read = open(soilmetrics_file, 'r')
-soilmetrics_query = soilmetrics_read.read()
-soilmetrics_read.close()
-soilmetrics_query = soilmetrics_query.replace(';', input_sql)
-soilmetrics_data = query_to_dataframe(database_connection, soilmetrics_query)
-
-# Read soil horizons data from AKVEG Database for selected site visits
-soilhorizons_read = open(soilhorizons_file, 'r')
-soilhorizons_query = soilhorizons_read.read()
-soilhorizons_read.close()
-soilhorizons_query = soilhorizons_query.replace(';', input_sql)
-soilhorizons_data = query_to_dataframe(database_connection, soilhorizons_query)
+# Extract remaining data for selected site visits
+tussock_data = visit_results['tussock']
+ground_data = visit_results['ground']
+structural_data = visit_results['structural']
+shrub_data = visit_results['shrub']
+
+# Convert cover type and height type to categorical
+tussock_data['cover_type'] = tussock_data['cover_type'].astype('category')
+shrub_data['height_type'] = shrub_data['height_type'].astype('category')
+environment_data = visit_results['environment']
+soilmetrics_data = visit_results['soilmetrics']
+soilhorizons_data = visit_results['soilhorizons']
 
 #### PROCESS VEGETATION STRUCTURE
 ####____________________________________________________
 
 # Calculate woody canopy height
-canopy_data = shrub_data[shrub_data['height_type'].isin(
+canopy_data = pd.DataFrame([summarize_field(shrub_data.loc[shrub_data['height_type'].isin(
     ['point-intercept mean', 'mean']
-)]['height_cm'].dropna().to_frame()
-canopy_data['height_cm'] = pd.to_numeric(canopy_data['height_cm'])
-canopy_data = canopy_data[canopy_data['height_cm'] != -999]
-canopy_data = (canopy_data['height_cm']
-               .agg(['mean',
-                     'std',
-                     'median',
-                     'min',
-                     'max',
-                     percentile_10,
-                     percentile_25,
-                     percentile_75,
-                     percentile_90])
-               .to_frame()
-               .transpose())
+), 'height_cm'], -999)])
 
 # Calculate whole tussock cover
-tussock_data = tussock_data[tussock_data['cover_type'].isin(
+tussock_data = pd.DataFrame([summarize_field(tussock_data.loc[tussock_data['cover_type'].isin(
     ['absolute foliar cover', 'absolute canopy cover']
-)]['cover_percent'].dropna().to_frame()
-tussock_data['cover_percent'] = pd.to_numeric(tussock_data['cover_percent'])
-tussock_data = tussock_data[tussock_data['cover_percent'] != -999]
-tussock_data = (tussock_data['cover_percent']
-                .agg(['mean',
-                      'std',
-                      'median',
-                      'min',
-                      'max',
-                      percentile_10,
-                      percentile_25,
-                      percentile_75,
-                      percentile_90])
-                .to_frame()
-                .transpose())
+), 'cover_percent'], -999)])
 
 # Create structure statistics
 table_structure = (pd.concat([canopy_data, tussock_data], axis=0)
+                   .rename_axis('Characteristic')
                    .reset_index()
-                   .rename(columns={'index': 'Characteristic',
-                                    'mean': 'Mean',
+                   .rename(columns={'mean': 'Mean',
                                     'percentile_10': '10th Percentile',
                                     'percentile_90': '90th Percentile'}))
 table_structure['Characteristic'] = np.where(table_structure['Characteristic'] == 'height_cm',
@@ -547,47 +970,10 @@ table_structure['Characteristic'] = np.where(table_structure['Characteristic'] =
 table_structure = table_structure[['Characteristic', 'Mean', '10th Percentile', '90th Percentile']]
 table_structure = table_structure.round(1)
 
-# Calculate vascular structure
-structure_vascular = (vascular_data
-                      # Calculate pivot table to sum taxon habit cover while filling zeros
-                      .pivot_table(index='site_visit_code',
-                                   columns='taxon_habit',
-                                   values='cover_percent',
-                                   aggfunc='sum',
-                                   fill_value=0)
-                      # Calculate mean cover by taxon habit
-                      .mean()
-                      .to_frame(name='mean')
-                      .rename(columns={'taxon_habit': 'structure'})
-                      )
-
-# Calculate bryophyte structure
-structure_bryophyte = (bryophyte_data
-                       # Calculate pivot table to sum taxon habit cover while filling zeros
-                       .pivot_table(index='site_visit_code',
-                                    columns='taxon_habit',
-                                    values='cover_percent',
-                                    aggfunc='sum',
-                                    fill_value=0)
-                       # Calculate mean cover by taxon habit
-                       .mean()
-                       .to_frame(name='mean')
-                       .rename(columns={'taxon_habit': 'structure'})
-                       )
-
-# Calculate lichen structure
-structure_lichen = (lichen_data
-                    # Calculate pivot table to sum taxon habit cover while filling zeros
-                    .pivot_table(index='site_visit_code',
-                                 columns='taxon_habit',
-                                 values='cover_percent',
-                                 aggfunc='sum',
-                                 fill_value=0)
-                    # Calculate mean cover by taxon habit
-                    .mean()
-                    .to_frame(name='mean')
-                    .rename(columns={'taxon_habit': 'structure'})
-                    )
+# Calculate mean cover by taxon habit for vascular plants, bryophytes, and lichens
+structure_vascular = habit_mean(vascular_data)
+structure_bryophyte = habit_mean(bryophyte_data)
+structure_lichen = habit_mean(lichen_data)
 
 # Concatenate biotic structure
 structure_biotic = pd.concat([structure_vascular, structure_bryophyte, structure_lichen], axis=0)
@@ -613,12 +999,10 @@ structure_summary = (pd.concat([structure_biotic, structure_abiotic], axis=0)
 
 # Remove zero values
 structure_summary = (structure_summary[structure_summary['mean'] > 0]
-                     .reset_index()
-                     .rename(columns={'index': 'structure'}))
+                     .rename_axis('structure')
+                     .reset_index())
 structure_summary = structure_summary[['structure', 'mean']]
-structure_summary['structure'] = (structure_summary['structure']
-                                  .str.title()
-                                  .replace('Spore-Bearing', 'Spore-bearing'))
+structure_summary['structure'] = format_habits(structure_summary['structure'])
 
 # Define standard element colors
 structure_colors = {
@@ -665,109 +1049,59 @@ structure_plot.update_layout(
 
 # Export to HTML (interactive) and PNG (publication)
 structure_output = os.path.join(plot_folder, unit_code + '_Structure.html')
-structure_plot.write_html(structure_output, config={'responsive': True})
+structure_plot.write_html(structure_output, include_plotlyjs='cdn', config={'responsive': True})
+if export_images:
+    ensure_kaleido()
+    structure_plot.write_image(os.path.join(plot_folder, unit_code + '_Structure.png'))
 
 #### PROCESS DIAGNOSTIC SPECIES SETS
 ####____________________________________________________
 
 # Read diagnostic schema data
-schema_data = pd.read_excel(schema_input, sheet_name='foliar_cover')[[
+schema_cache = cache_folder if use_schema_cache else None
+schema_data = read_excel_with_cache(schema_input, 'foliar_cover', ['target', 'constituents'], schema_cache)[[
     'target', 'constituents'
-]].rename(columns={'target': 'diagnostic set'}).dropna()
-schema_data['diagnostic set'].unique()
+]].rename(columns={'target': 'diagnostic set'}).dropna().astype({'diagnostic set': 'category'})
+
+# Index diagnostic sets by constituent taxon for joins
+schema_indexed = schema_data.set_index('constituents')['diagnostic set']
 
 # Join diagnostic schema to vascular data
-diagnostic_vascular = pd.merge(left=vascular_data,
-                               right=schema_data,
-                               left_on='name_accepted',
-                               right_on='constituents',
-                               how='inner')
+diagnostic_vascular = vascular_data.join(schema_indexed, on='name_accepted', how='inner')
 diagnostic_vascular = (diagnostic_vascular
-                       .groupby(['site_visit_code', 'diagnostic set'])['cover_percent']
+                       .groupby(['site_visit_code', 'diagnostic set'], observed=True)['cover_percent']
                        .sum()
-                       .to_frame()
                        .reset_index())
 
 # Join diagnostic schema to bryophyte data
-diagnostic_bryophyte = pd.merge(left=bryophyte_data,
-                                right=schema_data,
-                                left_on='name_accepted',
-                                right_on='constituents',
-                                how='inner')
+diagnostic_bryophyte = bryophyte_data.join(schema_indexed, on='name_accepted', how='inner')
 diagnostic_bryophyte = (diagnostic_bryophyte
-                        .groupby(['site_visit_code', 'diagnostic set'])['cover_percent']
+                        .groupby(['site_visit_code', 'diagnostic set'], observed=True)['cover_percent']
                         .sum()
-                        .to_frame()
                         .reset_index())
 
 # Calculate diagnostic constancy for vascular plants
-constancy_diagnostic_vasc = (diagnostic_vascular['diagnostic set']
-                             .value_counts()
-                             .to_frame()
-                             .rename(columns={'count': 'occurrences'}))
-constancy_diagnostic_vasc['constancy'] = (constancy_diagnostic_vasc['occurrences']
-                                          / len(diagnostic_vascular['site_visit_code'].unique())) * 100
+constancy_diagnostic_vasc = calculate_constancy(diagnostic_vascular, 'diagnostic set')
 
 # Calculate diagnostic constancy for bryophytes
-constancy_diagnostic_bryo = (diagnostic_bryophyte['diagnostic set']
-                             .value_counts()
-                             .to_frame()
-                             .rename(columns={'count': 'occurrences'}))
-constancy_diagnostic_bryo['constancy'] = (constancy_diagnostic_bryo['occurrences']
-                                          / len(diagnostic_bryophyte['site_visit_code'].unique())) * 100
+constancy_diagnostic_bryo = calculate_constancy(diagnostic_bryophyte, 'diagnostic set')
 
 # Concatenate constancy tables
-constancy_diagnostic = pd.concat([constancy_diagnostic_vasc.reset_index(),
-                                  constancy_diagnostic_bryo.reset_index()], axis=0)
+constancy_diagnostic = pd.concat([constancy_diagnostic_vasc, constancy_diagnostic_bryo], axis=0)
 
 # Summarize diagnostic sets for vascular plants
-cover_diagnostic_vasc = (diagnostic_vascular
-                         # Calculate pivot table to sum cover while filling zeros
-                         .pivot_table(index='site_visit_code',
-                                      columns='diagnostic set',
-                                      values='cover_percent',
-                                      aggfunc='sum',
-                                      fill_value=0)
-                         .agg(['mean',
-                               'std',
-                               'median',
-                               'min',
-                               'max',
-                               percentile_10,
-                               percentile_25,
-                               percentile_75,
-                               percentile_90])
-                         .transpose()
-                         )
+cover_diagnostic_vasc = summarize_cover(diagnostic_vascular, 'diagnostic set')
 
 # Summarize diagnostic sets for bryophytes
-cover_diagnostic_bryo = (diagnostic_bryophyte
-                         # Calculate pivot table to sum cover while filling zeros
-                         .pivot_table(index='site_visit_code',
-                                      columns='diagnostic set',
-                                      values='cover_percent',
-                                      aggfunc='sum',
-                                      fill_value=0)
-                         .agg(['mean',
-                               'std',
-                               'median',
-                               'min',
-                               'max',
-                               percentile_10,
-                               percentile_25,
-                               percentile_75,
-                               percentile_90])
-                         .transpose()
-                         )
+cover_diagnostic_bryo = summarize_cover(diagnostic_bryophyte, 'diagnostic set')
 
 # Concatenate cover tables
 cover_diagnostic = pd.concat([cover_diagnostic_vasc, cover_diagnostic_bryo], axis=0)
 
 # Join diagnostic data
-stats_diagnostic = (pd.merge(left=constancy_diagnostic.reset_index(),
-                             right=cover_diagnostic.reset_index(),
-                             on='diagnostic set',
-                             how='left')
+stats_diagnostic = (constancy_diagnostic
+                    .join(cover_diagnostic, how='left')
+                    .reset_index()
                     .round(1)
                     .rename(columns={'percentile_10': '10th percentile',
                                      'percentile_25': '25th percentile',
@@ -786,7 +1120,7 @@ stats_diagnostic = stats_diagnostic.sort_values(by='mean', ascending=True)
 stats_diagnostic['range_width'] = stats_diagnostic['90th percentile'] - stats_diagnostic['10th percentile']
 
 # Create custom data array
-custom_diagnostic = np.stack([stats_diagnostic['constancy'], stats_diagnostic['90th percentile']], axis=-1)
+custom_diagnostic = stats_diagnostic[['constancy', '90th percentile']].to_numpy()
 
 # Calculate plot height
 height_diagnostic = 50 * len(stats_diagnostic)
@@ -864,108 +1198,30 @@ diagnostic_plot.update_layout(
 
 # Export to HTML (interactive) and PNG (publication)
 diagnostic_output = os.path.join(plot_folder, unit_code + '_DiagnosticSets.html')
-diagnostic_plot.write_html(diagnostic_output, config={'responsive': True})
+diagnostic_plot.write_html(diagnostic_output, include_plotlyjs='cdn', config={'responsive': True})
+if export_images:
+    ensure_kaleido()
+    diagnostic_plot.write_image(os.path.join(plot_folder, unit_code + '_DiagnosticSets.png'))
 
 #### PROCESS SPECIES COMPOSITION
 ####____________________________________________________
 
-# Calculate vascular constancy
-constancy_vascular = (vascular_data['name_accepted']
-                      .value_counts()
-                      .to_frame()
-                      .rename(columns={'count': 'occurrences'}))
-constancy_vascular['constancy'] = (constancy_vascular['occurrences']
-                                   / len(vascular_data['site_visit_code'].unique())) * 100
-
-# Calculate bryophyte constancy
-constancy_bryophyte = (bryophyte_data['name_accepted']
-                       .value_counts()
-                       .to_frame()
-                       .rename(columns={'count': 'occurrences'}))
-constancy_bryophyte['constancy'] = (constancy_bryophyte['occurrences']
-                                    / len(bryophyte_data['site_visit_code'].unique())) * 100
-
-# Calculate lichen constancy
-constancy_lichen = (lichen_data['name_accepted']
-                    .value_counts()
-                    .to_frame()
-                    .rename(columns={'count': 'occurrences'}))
-constancy_lichen['constancy'] = (constancy_lichen['occurrences']
-                                 / len(lichen_data['site_visit_code'].unique())) * 100
+# Combine taxonomic groups for species composition
+composition_data = (pd.concat([vascular_data.assign(kind='vascular'),
+                               bryophyte_data.assign(kind='bryophyte'),
+                               lichen_data.assign(kind='lichen')], ignore_index=True)
+                    .astype({'site_visit_code': 'category', 'name_accepted': 'category'}))
 
-# Concatenate constancy tables
-constancy_composition = pd.concat([constancy_vascular.reset_index(),
-                                   constancy_bryophyte.reset_index(),
-                                   constancy_lichen.reset_index()], axis=0)
-
-# Calculate vascular cover statistics
-cover_vascular = (vascular_data
-                  # Calculate pivot table to sum cover while filling zeros
-                  .pivot_table(index='site_visit_code',
-                               columns='name_accepted',
-                               values='cover_percent',
-                               aggfunc='sum',
-                               fill_value=0)
-                  .agg(['mean',
-                        'std',
-                        'median',
-                        'min',
-                        'max',
-                        percentile_10,
-                        percentile_25,
-                        percentile_75,
-                        percentile_90])
-                  .transpose()
-                  )
-
-# Calculate bryophyte cover statistics
-cover_bryophyte = (bryophyte_data
-                   # Calculate pivot table to sum cover while filling zeros
-                   .pivot_table(index='site_visit_code',
-                                columns='name_accepted',
-                                values='cover_percent',
-                                aggfunc='sum',
-                                fill_value=0)
-                   .agg(['mean',
-                         'std',
-                         'median',
-                         'min',
-                         'max',
-                         percentile_10,
-                         percentile_25,
-                         percentile_75,
-                         percentile_90])
-                   .transpose()
-                   )
-
-# Calculate lichen cover statistics
-cover_lichen = (lichen_data
-                # Calculate pivot table to sum cover while filling zeros
-                .pivot_table(index='site_visit_code',
-                             columns='name_accepted',
-                             values='cover_percent',
-                             aggfunc='sum',
-                             fill_value=0)
-                .agg(['mean',
-                      'std',
-                      'median',
-                      'min',
-                      'max',
-                      percentile_10,
-                      percentile_25,
-                      percentile_75,
-                      percentile_90])
-                .transpose()
-                )
+# Calculate constancy within each taxonomic group
+constancy_composition = calculate_constancy(composition_data, 'name_accepted', 'kind')
 
-# Concatenate cover tables
-cover_composition = pd.concat([cover_vascular, cover_bryophyte, cover_lichen], axis=0)
+# Calculate cover statistics within each taxonomic group
+cover_composition = summarize_cover(composition_data, 'name_accepted', 'kind')
 
 # Join statistics for species composition
-stats_composition = (pd.merge(left=constancy_composition,
-                              right=cover_composition,
-                              on='name_accepted',
-                              how='left')
+stats_composition = (constancy_composition
+                     .join(cover_composition, how='left')
+                     .reset_index()
                      .round(1)
                      .rename(columns={'percentile_10': '10th percentile',
                                       'percentile_25': '25th percentile',
@@ -996,44 +1252,32 @@ table_composition = (stats_composition[
 stats_composition['range_width'] = stats_composition['75th percentile'] - stats_composition['25th percentile']
 
 # Append taxon habit
-stats_composition = pd.merge(left=stats_composition,
-                             right=taxa_data,
-                             left_on='name_accepted',
-                             right_on='taxon_name',
-                             how='left')
-stats_composition['taxon_habit'] = (stats_composition['taxon_habit']
-                                    .str.title()
-                                    .replace('Spore-Bearing', 'Spore-bearing'))
-stats_composition['taxon_habit'] = np.where(stats_composition['name_accepted'] == 'moss', 'Moss',
-                                            stats_composition['taxon_habit'])
-
-# Assign bar colors
-bar_colors = stats_composition['taxon_habit'].map(structure_colors)
-
-# Create custom data array
-custom_data = np.stack([stats_composition['taxon_habit'], stats_composition['75th percentile']], axis=-1)
+stats_composition = stats_composition.join(taxa_data.set_index('taxon_name')['taxon_habit'],
+                                           on='name_accepted')
+stats_composition['taxon_habit'] = (format_habits(stats_composition['taxon_habit'])
+                                    .mask(stats_composition['name_accepted'] == 'moss', 'Moss'))
 
 # Calculate plot height
 height_composition = 50 * len(stats_composition)
 
-# Create floristic composition range plot
+# Create floristic composition range plot with one bar trace per taxon habit to generate legend entries
 composition_plot = go.Figure()
-composition_plot.add_trace(go.Bar(
-    y=stats_composition['name_accepted'],
-    x=stats_composition['range_width'],
-    base=stats_composition['25th percentile'],
-    orientation='h',
-    width=0.4,
-    name='25th-75th Range',
-    marker=dict(
-        color=bar_colors,
-        line=dict(width=0)
-    ),
-    customdata=custom_data,
-    hovertemplate='%{y}<br>Habit: %{customdata[0]}<br>25th Percentile: %{base}%<br>75th Percentile: %{customdata[1]}%<extra></extra>',
-    # Remove legend
-    showlegend=False
-))
+for habit, habit_data in stats_composition.groupby('taxon_habit', sort=False, dropna=False):
+    composition_plot.add_trace(go.Bar(
+        y=habit_data['name_accepted'],
+        x=habit_data['range_width'],
+        base=habit_data['25th percentile'],
+        orientation='h',
+        width=0.4,
+        name=habit,
+        legendgroup=habit,
+        marker=dict(
+            color=structure_colors.get(habit),
+            line=dict(width=0)
+        ),
+        customdata=habit_data[['taxon_habit', '75th percentile']].to_numpy(),
+        hovertemplate='%{y}<br>Habit: %{customdata[0]}<br>25th Percentile: %{base}%<br>75th Percentile: %{customdata[1]}%<extra></extra>'
+    ))
 
 # Add scatterplot for means
 composition_plot.add_trace(go.Scatter(
@@ -1050,18 +1294,6 @@ composition_plot.add_trace(go.Scatter(
     hovertemplate='%{y}<br>Mean Cover: %{x}%<extra></extra>',
 ))
 
-# Identify taxon habits
-taxon_habits = stats_composition['taxon_habit'].unique()
-for habit in taxon_habits:
-    color = structure_colors.get(habit)
-    # Add an empty bar trace for each habit to generate a legend entry
-    composition_plot.add_trace(go.Bar(
-        x=[None], y=[None],
-        name=habit,
-        marker_color=color,
-        marker_line_width=0
-    ))
-
 # Update Layout
 composition_plot.update_layout(
     # title='Cover Range 25th to 75th Percentile',
@@ -1072,6 +1304,12 @@ composition_plot.update_layout(
     template='plotly_white',
     showlegend=True,
     font=dict(size=18),
+    # Overlay habit traces and keep taxa in order of mean cover
+    barmode='overlay',
+    yaxis=dict(
+        categoryorder='array',
+        categoryarray=stats_composition['name_accepted']
+    ),
     xaxis=dict(
         showline=True,
         linecolor='black',
@@ -1100,216 +1338,62 @@ composition_plot.update_layout(
 
 # Export to HTML (interactive) and PNG (publication)
 composition_output = os.path.join(plot_folder, unit_code + '_SpeciesComposition.html')
-composition_plot.write_html(composition_output, config={'responsive': True})
+composition_plot.write_html(composition_output, include_plotlyjs='cdn', config={'responsive': True})
+if export_images:
+    ensure_kaleido()
+    composition_plot.write_image(os.path.join(plot_folder, unit_code + '_SpeciesComposition.png'))
 
 #### PROCESS ENVIRONMENT DATA
 ####____________________________________________________
 
-# Calculate physiography
-physiography_data = environment_data['physiography'].dropna().to_frame()
-physiography_frequency = physiography_data['physiography'].value_counts().to_frame().reset_index()
-physiography_frequency['frequency'] = (physiography_frequency['count'] / len(physiography_data)) * 100
-physiography_frequency = physiography_frequency[physiography_frequency['frequency'] >= 10]
-physiography_list = physiography_frequency['physiography'].unique()
-physiography_text = ''
-for x in physiography_list:
-    physiography_text = physiography_text + x + '; '
-physiography_text = physiography_text[:-2]
-
-# Calculate geomorphology
-geomorph_data = environment_data['geomorphology'].dropna().to_frame()
-geomorph_frequency = geomorph_data['geomorphology'].value_counts().to_frame().reset_index()
-geomorph_frequency['frequency'] = (geomorph_frequency['count'] / len(geomorph_data)) * 100
-geomorph_frequency = geomorph_frequency[geomorph_frequency['frequency'] >= 10]
-geomorph_list = geomorph_frequency['geomorphology'].unique()
-geomorph_text = ''
-for x in geomorph_list:
-    geomorph_text = geomorph_text + x + '; '
-geomorph_text = geomorph_text[:-2]
-
-# Calculate macrotopography
-macrotopo_data = environment_data['macrotopography'].dropna().to_frame()
-macrotopo_frequency = macrotopo_data['macrotopography'].value_counts().to_frame().reset_index()
-macrotopo_frequency['frequency'] = (macrotopo_frequency['count'] / len(macrotopo_data)) * 100
-macrotopo_frequency = macrotopo_frequency[macrotopo_frequency['frequency'] >= 10]
-macrotopo_list = macrotopo_frequency['macrotopography'].unique()
-macrotopo_text = ''
-for x in macrotopo_list:
-    macrotopo_text = macrotopo_text + x + '; '
-macrotopo_text = macrotopo_text[:-2]
-
-# Calculate microtopography
-microtopo_data = environment_data['microtopography'].dropna().to_frame()
-microtopo_frequency = microtopo_data['microtopography'].value_counts().to_frame().reset_index()
-microtopo_frequency['frequency'] = (microtopo_frequency['count'] / len(microtopo_data)) * 100
-microtopo_frequency = microtopo_frequency[microtopo_frequency['frequency'] >= 10]
-microtopo_list = microtopo_frequency['microtopography'].unique()
-microtopo_text = ''
-for x in microtopo_list:
-    microtopo_text = microtopo_text + x + '; '
-microtopo_text = microtopo_text[:-2]
-
-# Calculate moisture regime
-moisture_data = environment_data['moisture_regime'].dropna().to_frame()
-moisture_frequency = moisture_data['moisture_regime'].value_counts().to_frame().reset_index()
-moisture_frequency['frequency'] = (moisture_frequency['count'] / len(moisture_data)) * 100
-moisture_frequency = moisture_frequency[moisture_frequency['frequency'] >= 20]
-moisture_list = moisture_frequency['moisture_regime'].unique()
-moisture_text = ''
-for x in moisture_list:
-    moisture_text = moisture_text + x + '; '
-moisture_text = moisture_text[:-2]
-
-# Calculate restrictive layer
-restrict_data = environment_data['restrictive_type'].dropna().to_frame()
-restrict_frequency = restrict_data['restrictive_type'].value_counts().to_frame().reset_index()
-restrict_frequency['frequency'] = (restrict_frequency['count'] / len(restrict_data)) * 100
-restrict_frequency = restrict_frequency[restrict_frequency['frequency'] >= 20]
-restrict_list = restrict_frequency['restrictive_type'].unique()
-restrict_text = ''
-for x in restrict_list:
-    restrict_text = restrict_text + x + '; '
-restrict_text = restrict_text[:-2]
+# Set minimum frequency (%) for reporting categorical environment characteristics
+environment_thresholds = {'physiography': 10,
+                          'geomorphology': 10,
+                          'macrotopography': 10,
+                          'microtopography': 10,
+                          'moisture_regime': 20,
+                          'restrictive_type': 20}
+
+# Calculate frequency of categorical environment characteristics
+environment_frequency = (environment_data[list(environment_thresholds)]
+                         .melt(var_name='variable', value_name='value')
+                         .dropna()
+                         .groupby(['variable', 'value'], sort=False)
+                         .size()
+                         .rename('count')
+                         .reset_index()
+                         .sort_values('count', ascending=False, kind='stable'))
+environment_frequency['frequency'] = (environment_frequency['count']
+                                      / environment_frequency.groupby('variable', sort=False)['count'].transform('sum')
+                                      * 100)
+environment_frequency = environment_frequency[
+    environment_frequency['frequency'] >= environment_frequency['variable'].map(environment_thresholds)
+]
+
+# Compile frequent categories into text
+environment_text = environment_frequency.groupby('variable', sort=False)['value'].agg('; '.join)
+physiography_text = environment_text.get('physiography', '')
+geomorph_text = environment_text.get('geomorphology', '')
+macrotopo_text = environment_text.get('macrotopography', '')
+microtopo_text = environment_text.get('microtopography', '')
+moisture_text = environment_text.get('moisture_regime', '')
+restrict_text = environment_text.get('restrictive_type', '')
 
 # Calculate surface water
-surfacewater_data = environment_data['surface_water'].dropna().to_frame()
-surfacewater_frequency = surfacewater_data['surface_water'].value_counts().to_frame()
-surfacewater_frequency['frequency'] = (surfacewater_frequency['count'] / len(surfacewater_data)) * 100
-surfacewater_frequency = surfacewater_frequency[surfacewater_frequency['frequency'] >= 20]
-surfacewater_frequency = str(round(surfacewater_frequency.at[True, 'frequency'], 1)) + '%'
-
-# Calculate elevation
-elevation_data = site_visit_data[['site_visit_code', 'elevation_m']].dropna()
-elevation_data['elevation_m'] = pd.to_numeric(elevation_data['elevation_m'])
-elevation_data = elevation_data[elevation_data['elevation_m'] != -32768]
-elevation_data = (elevation_data['elevation_m']
-                  .agg(['mean',
-                        'std',
-                        'median',
-                        'min',
-                        'max',
-                        percentile_10,
-                        percentile_25,
-                        percentile_75,
-                        percentile_90])
-                  .to_frame()
-                  .transpose())
-
-# Calculate slope
-slope_data = site_visit_data[['site_visit_code', 'slope_deg']].dropna()
-slope_data['slope_deg'] = pd.to_numeric(slope_data['slope_deg'])
-slope_data = slope_data[slope_data['slope_deg'] != -32768]
-slope_data = (slope_data['slope_deg']
-              .agg(['mean',
-                    'std',
-                    'median',
-                    'min',
-                    'max',
-                    percentile_10,
-                    percentile_25,
-                    percentile_75,
-                    percentile_90])
-              .to_frame()
-              .transpose())
-
-# Calculate water depth
-waterdepth_data = environment_data[['site_visit_code', 'depth_water_cm']].dropna()
-waterdepth_data['depth_water_cm'] = pd.to_numeric(waterdepth_data['depth_water_cm'])
-waterdepth_data = waterdepth_data[waterdepth_data['depth_water_cm'] != -999]
-waterdepth_data = (waterdepth_data['depth_water_cm']
-                   .agg(['mean',
-                         'std',
-                         'median',
-                         'min',
-                         'max',
-                         percentile_10,
-                         percentile_25,
-                         percentile_75,
-                         percentile_90])
-                   .to_frame()
-                   .transpose())
-
-# Calculate moss duff depth
-mossduff_data = environment_data['depth_moss_duff_cm'].dropna().to_frame()
-mossduff_data['depth_moss_duff_cm'] = pd.to_numeric(mossduff_data['depth_moss_duff_cm'])
-mossduff_data = mossduff_data[mossduff_data['depth_moss_duff_cm'] != -999]
-mossduff_data = (mossduff_data['depth_moss_duff_cm']
-                 .agg(['mean',
-                       'std',
-                       'median',
-                       'min',
-                       'max',
-                       percentile_10,
-                       percentile_25,
-                       percentile_75,
-                       percentile_90])
-                 .to_frame()
-                 .transpose())
-
-# Calculate restrictive layer depth
-restictdepth_data = environment_data['depth_restrictive_layer_cm'].dropna().to_frame()
-restictdepth_data['depth_restrictive_layer_cm'] = pd.to_numeric(
-    restictdepth_data['depth_restrictive_layer_cm']
-)
-restictdepth_data = restictdepth_data[restictdepth_data['depth_restrictive_layer_cm'] != -999]
-restictdepth_data = (restictdepth_data['depth_restrictive_layer_cm']
-                     .agg(['mean',
-                           'std',
-                           'median',
-                           'min',
-                           'max',
-                           percentile_10,
-                           percentile_25,
-                           percentile_75,
-                           percentile_90])
-                     .to_frame()
-                     .transpose())
-
-# Calculate pH
-pH_data = soilmetrics_data['ph'].dropna().to_frame()
-pH_data['ph'] = pd.to_numeric(pH_data['ph'])
-pH_data = pH_data[pH_data['ph'] != -999]
-pH_data = (pH_data['ph']
-           .agg(['mean',
-                 'std',
-                 'median',
-                 'min',
-                 'max',
-                 percentile_10,
-                 percentile_25,
-                 percentile_75,
-                 percentile_90])
-           .to_frame()
-           .transpose())
-
-# Calculate conductivity
-conductivity_data = soilmetrics_data['conductivity_mus'].dropna().to_frame()
-conductivity_data['conductivity_mus'] = pd.to_numeric(conductivity_data['conductivity_mus'])
-conductivity_data = conductivity_data[conductivity_data['conductivity_mus'] != -999]
-conductivity_data = (conductivity_data['conductivity_mus']
-                     .agg(['mean',
-                           'std',
-                           'median',
-                           'min',
-                           'max',
-                           percentile_10,
-                           percentile_25,
-                           percentile_75,
-                           percentile_90])
-                     .to_frame()
-                     .transpose())
-
-# Concatenate quantitative metrics
-stats_environment = (pd.concat([elevation_data,
-                               slope_data,
-                               waterdepth_data,
-                               mossduff_data,
-                               restictdepth_data,
-                               pH_data,
-                               conductivity_data], axis=0)
+surfacewater_share = environment_data['surface_water'].value_counts(normalize=True) * 100
+surfacewater_frequency = str(round(surfacewater_share.get(True, 0), 1)) + '%'
+
+# Summarize quantitative environment metrics excluding missing value sentinels
+stats_environment = (pd.DataFrame([summarize_field(site_visit_data['elevation_m'], -32768),
+                                   summarize_field(site_visit_data['slope_deg'], -32768),
+                                   summarize_field(environment_data['depth_water_cm'], -999),
+                                   summarize_field(environment_data['depth_moss_duff_cm'], -999),
+                                   summarize_field(environment_data['depth_restrictive_layer_cm'], -999),
+                                   summarize_field(soilmetrics_data['ph'], -999),
+                                   summarize_field(soilmetrics_data['conductivity_mus'], -999)])
+                     .rename_axis('Characteristic')
                      .reset_index()
-                     .rename(columns={'index': 'Characteristic',
-                                      'mean': 'Mean',
+                     .rename(columns={'mean': 'Mean',
                                       'percentile_10': '10th Percentile',
                                       'percentile_90': '90th Percentile'}))
 
@@ -1370,14 +1454,26 @@ composition_iframe = f'''<iframe
     style="border: none; display: block; overflow: hidden;">
 </iframe>'''
 
-# Define Replacements
+# Define replacements for plain text
 title_replace = f'**Unit Name:** {unit_name}'
 photo_replace = f'**Photos:** {photo_text}'
-replacements = {
+text_replacements = {
     '# Description Data Entry': f'# {unit_name}',
-    title_replace: '',
     '[unit_name]': unit_name,
     '[level]': level_text.lower(),
+    '[physiography_text]': physiography_text,
+    '[geomorph_text]': geomorph_text,
+    '[macrotopo_text]': macrotopo_text,
+    '[microtopo_text]': microtopo_text,
+    '[moisture_text]': moisture_text,
+    '[restrict_text]': restrict_text,
+    '[surfacewater_frequency]': surfacewater_frequency
+}
+
+# Define replacements with plain text escaped for html and html fragments passed unchanged
+replacements = {
+    **{key: html.escape(value, quote=False) for key, value in text_replacements.items()},
+    title_replace: '',
     photo_replace: photo_html,
     '[table_structure]': table_structure.to_html(
         classes='table table-bordered', index=False, border=0
@@ -1388,233 +1484,15 @@ replacements = {
         classes='table table-bordered', index=False, border=0
     ),
     '[composition_plot]': composition_iframe,
-    '[physiography_text]': physiography_text,
-    '[geomorph_text]': geomorph_text,
-    '[macrotopo_text]': macrotopo_text,
-    '[microtopo_text]': microtopo_text,
-    '[moisture_text]': moisture_text,
-    '[restrict_text]': restrict_text,
-    '[surfacewater_frequency]': surfacewater_frequency,
     '[table_environment]': table_environment.to_html(
         classes='table table-bordered', index=False, border=0
     )
 }
 
-# Process markdown file to html
-with open(text_input, 'r', encoding='utf-8') as input_file:
-    md_content = input_file.read()
-
-# Replace text placeholders with html
-for key, value in replacements.items():
-    md_content = md_content.replace(key, str(value))
-
-# Render tables
-html_content = markdown.markdown(md_content, extensions=['tables', 'toc'])
-
-# Define styles
-rmarkdown_style = """
-<style>
-    body {
-        font-family: "Helvetica Neue", Helvetica, Arial, sans-serif;
-        font-size: 16px;
-        line-height: 1.6;
-        color: #333;
-        background-color: #fff;
-        margin: 0;
-        padding: 0;
-    }
-
-    /* Layout Wrapper */
-    .wrapper {
-        display: flex;
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-
-    /* Sidebar Navigation (TOC) */
-    #TOC {
-        width: 250px;
-        position: fixed;
-        top: 0;
-        left: 0;
-        bottom: 0;
-        overflow-y: auto;
-        padding: 40px 20px;
-        background-color: #f8f8f8;
-        border-right: 1px solid #e7e7e7;
-        font-size: 0.9em;
-    }
-    #TOC ul {
-        list-style: none;
-        padding-left: 0;
-        margin: 0;
-    }
-    #TOC ul ul {
-        padding-left: 20px; /* Indent nested levels */
-    }
-    #TOC li {
-        margin-bottom: 8px;
-    }
-    #TOC a {
-        color: #333;
-        text-decoration: none;
-        display: block;
-        padding: 6px 10px;
-        border-radius: 4px;
-        transition: background-color 0.1s;
-    }
-    #TOC a:hover {
-        color: #337ab7;
-        background-color: #eee;
-    }
-
-    /* Main Content */
-    .main-content {
-        margin-left: 270px; /* Sidebar width + gap */
-        padding: 40px 40px;
-        max-width: 850px;
-        flex: 1;
-    }
-
-    /* Typography */
-    h1, h2, h3 {
-        color: #333;
-        font-weight: 600;
-        margin-bottom: 0.5em;
-        scroll-margin-top: 20px; /* Offset for anchor links */
-    }
-    h1 { font-size: 2.2em; border-bottom: 1px solid #eee; padding-bottom: 10px; }
-    h2 { font-size: 1.6em; border-bottom: 1px solid #eee; padding-bottom: 5px; }
-    h3 { font-size: 1.3em; }
-
-    /* Tables */
-    table {
-        width: 100%;
-        margin-bottom: 20px;
-        border-collapse: collapse;
-        font-size: 0.9em;
-    }
-    th, td { padding: 8px 12px; text-align: left; border-top: 1px solid #ddd; }
-    th { font-weight: bold; border-bottom: 2px solid #ddd; }
-    tr:hover {
-        background-color: #e6f7ff;
-    }
-
-    /* Images */
-    img {
-        max-width: 100%;
-        display: block; /* Default block, inline-block handled inline */
-        margin: 20px auto;
-        box-shadow: 0 0 5px rgba(0,0,0,0.1);
-    }
-
-    /* Links */
-    .main-content a { color: #337ab7; text-decoration: none; }
-    .main-content a:hover { text-decoration: underline; }
-
-    /* Mobile Responsive */
-    @media (max-width: 768px) {
-        #TOC {
-            position: relative;
-            width: 100%;
-            height: auto;
-            border-right: none;
-            border-bottom: 1px solid #e7e7e7;
-        }
-        .main-content {
-            margin-left: 0;
-            padding: 20px;
-        }
-        .wrapper { display: block; }
-    }
-</style>
-"""
-
-# JavaScript to auto-generate TOC
-toc_script = """
-<script>
-document.addEventListener("DOMContentLoaded", function() {
-    var toc = document.getElementById('TOC');
-    var content = document.querySelector('.main-content');
-
-    // UPDATED: Only select h2 and h3
-    var headers = content.querySelectorAll('h2, h3');
-    var tocList = document.createElement('ul');
-
-    if (headers.length > 0) {
-        var currentLevel = 1; 
-        var currentList = tocList;
-        var listStack = [tocList]; 
-
-        headers.forEach(function(header, index) {
-            if (!header.id) {
-                header.id = 'header-' + index;
-            }
-
-            // UPDATED: Normalize levels. 
-            // h2 (level 2) becomes 1. h3 (level 3) becomes 2.
-            var level = parseInt(header.tagName.substring(1)) - 1;
-
-            // Adjust nesting
-            if (level > currentLevel) {
-                while (level > currentLevel) {
-                    var newList = document.createElement('ul');
-                    if (currentList.lastElementChild) {
-                        currentList.lastElementChild.appendChild(newList);
-                    } else {
-                        var li = document.createElement('li');
-                        currentList.appendChild(li);
-                        li.appendChild(newList);
-                    }
-                    currentList = newList;
-                    listStack.push(currentList);
-                    currentLevel++;
-                }
-            } else if (level < currentLevel) {
-                while (level < currentLevel) {
-                    listStack.pop();
-                    currentList = listStack[listStack.length - 1];
-                    currentLevel--;
-                }
-            }
-
-            var li = document.createElement('li');
-            var a = document.createElement('a');
-            a.href = '#' + header.id;
-            a.textContent = header.textContent;
-            li.appendChild(a);
-            currentList.appendChild(li);
-        });
-
-        toc.appendChild(tocList);
-    }
-});
-</script>
-"""
-
-# Create html text string
-final_html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{unit_name}</title>
-    {rmarkdown_style}
-</head>
-<body>
-    <div class="wrapper">
-        <div id="TOC">
-            </div>
-        <div class="main-content">
-            {html_content}
-        </div>
-    </div>
-    {toc_script}
-</body>
-</html>
-"""
+# Render markdown description to html
+html_cache = cache_folder if use_html_cache else None
+render_description(md_content, replacements, unit_name, html_output, html_cache)
 
-# Export html file
-with open(html_output, 'w', encoding='utf-8') as output_file:
-    output_file.write(final_html)
+# Write precompressed html for static hosting
+if export_compressed:
+    write_gzip_copy(html_output)